@@ -1,14 +1,29 @@
+import os
 import uvicorn
 from fastapi import FastAPI, HTTPException, Depends
 
 from common.utils import *
 from metadata_server import MetadataServer
+from scheduler.admission import AdmissionConfig
 
 # Create FastAPI app
 app = FastAPI(title="Metadata Server API", description="API for managing compute nodes and memory pools")
 
+# Enable prefill admission control by setting a per CN request cap
+max_requests_per_cn = int(os.environ.get("MAX_REQUESTS_PER_CN", 0))
+admission_config = None
+if max_requests_per_cn > 0:
+    max_wait = os.environ.get("ADMISSION_MAX_WAIT")
+    admission_config = AdmissionConfig(
+        max_requests_per_cn=max_requests_per_cn,
+        max_queue_len=int(os.environ.get("ADMISSION_MAX_QUEUE_LEN", 1024)),
+        max_wait=float(max_wait) if max_wait else None,
+        admit_grace=float(os.environ.get("ADMISSION_ADMIT_GRACE", 1.0)),
+        poll_timeout=float(os.environ.get("ADMISSION_POLL_TIMEOUT", 30.0)),
+        result_ttl=float(os.environ.get("ADMISSION_RESULT_TTL", 30.0)))
+
 # Create a global instance of MetadataServer
-metadata_server = MetadataServer()
+metadata_server = MetadataServer(admission_config=admission_config)
 
 # Dependency to get the metadata server instance
 def get_metadata_server():
@@ -37,11 +52,41 @@ def add_memnode(mn_info: MemNodeCreate, server: MetadataServer = Depends(get_met
 ##############################################################
 @app.post("/compnode/schedule_prefill")
 def schedule_prefill(request: GetCompNode, server: MetadataServer = Depends(get_metadata_server)):
-    """Schudule a comp node for prefilling stage."""
+    """Schudule a comp node for prefilling stage.
+
+    Without admission control, data is the schedule (cn_host_ip, mn_host_ip,
+    cn_port, direct_hybrid_decode).
+    With admission control (MAX_REQUESTS_PER_CN set), data is
+    {status, ticket_id, estimated_wait, schedule} where status is:
+    - "admitted": schedule is set, send the request to it
+    - "queued": poll /compnode/schedule_prefill/poll with ticket_id until
+      admitted, or give up via /compnode/schedule_prefill/cancel. Tickets not
+      polled within the poll timeout are dropped (poll returns 404).
+    - "rejected": the server is overloaded, retry later or fail the request
+    estimated_wait is in seconds and may be null if unknown.
+    """
     print(f"Schedule a prefill")
     ret = server.schedule_prefill(request)
     return {"data": ret}
 
+@app.post("/compnode/schedule_prefill/poll")
+def poll_prefill(ticket: AdmissionTicket, server: MetadataServer = Depends(get_metadata_server)):
+    """Poll a queued prefill request, return the schedule once admitted."""
+    try:
+        ret = server.poll_prefill(ticket.ticket_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"data": ret}
+
+@app.post("/compnode/schedule_prefill/cancel")
+def cancel_prefill(ticket: AdmissionTicket, server: MetadataServer = Depends(get_metadata_server)):
+    """Cancel a queued prefill request."""
+    try:
+        server.cancel_prefill(ticket.ticket_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"status": f"Cancel ticket {ticket.ticket_id} success"}
+
 @app.post("/compnode/schedule_decode")
 def schedule_decode(request: GetCompNode, server: MetadataServer = Depends(get_metadata_server)):
     """Schudule a comp node for prefilling stage."""
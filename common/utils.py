@@ -1,11 +1,16 @@
 from dataclasses import dataclass
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 HostIP = str
 PORT = int
 
+# Prefill admission priority range, lower is served first. The default is the
+# highest priority so clients can only deprioritize their own requests.
+MIN_PRIORITY = 0
+MAX_PRIORITY = 9
+
 
 # Pydantic models for request/response validation
 
@@ -26,6 +31,12 @@ class GetCompNode(BaseModel):
     block_hashes: List[int]
     # Used for schedule decode
     direct_hybrid: Optional[bool] = None
+    # Used for prefill admission control, lower priority is served first
+    tenant: Optional[str] = None
+    priority: int = Field(default=MIN_PRIORITY, ge=MIN_PRIORITY, le=MAX_PRIORITY)
+
+class AdmissionTicket(BaseModel):
+    ticket_id: int
 
 # Node sync
 class CompNodeSync(BaseModel):
@@ -54,6 +65,14 @@ class ScheduleDecodeOutput:
     mn_host_ip: Optional[HostIP]
     cn_port: int
 
+@dataclass
+class AdmissionOutput:
+    status: str # admitted or queued or rejected
+    ticket_id: Optional[int] = None
+    # Seconds, None if the drain rate is unknown
+    estimated_wait: Optional[float] = None
+    schedule: Optional[SchedulePrefillOutput] = None
+
 
 class Counter:
 
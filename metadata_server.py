@@ -1,17 +1,20 @@
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple, Union
 
 from nodes.comp_node import CompNode
 from nodes.mem_node import MemNode
 from nodes.utils import MN2CNs, CPUCNs
 from common.utils import (HostIP, PORT, GetCompNode,
                           CompNodeCreate, MemNodeCreate,
-                          MemNodeSync, CompNodeSync)
+                          MemNodeSync, CompNodeSync, AdmissionOutput,
+                          SchedulePrefillOutput)
 from scheduler.factory import SchedulerFactory
+from scheduler.admission import AdmissionConfig, AdmissionController
 
 
 class MetadataServer:
 
-    def __init__(self, block_size: int = 16) -> None:
+    def __init__(self, block_size: int = 16,
+                 admission_config: Optional[AdmissionConfig] = None) -> None:
         self.block_size = block_size
 
         # This node means physical node that contains memory nodes and GPU engines
@@ -23,6 +26,14 @@ class MetadataServer:
             "Naive", self.prefill_nodes, self.decode_nodes, self.cpu_nodes)
         print(f"Init {self.scheduler.name}")
 
+        # Admission control for prefill, disabled if no config given
+        self.admission = None
+        if admission_config is not None:
+            self.admission = AdmissionController(
+                admission_config, self.prefill_nodes, self.scheduler)
+            print(f"Init admission control with "
+                  f"{admission_config.max_requests_per_cn} requests per CN")
+
 
     ##############################################################
     #                      Add Nodes APIs                        #
@@ -33,7 +44,12 @@ class MetadataServer:
         if cn_info.role == "prefill":
             host = cn_info.host
             assert host in self.prefill_nodes
-            self.prefill_nodes[host].comp_nodes[cn_info.port] = compnode
+            # Admission control iterates prefill cns under its lock, a new cn
+            # also brings free slots for queued requests
+            if self.admission is not None:
+                self.admission.add_cn(host, cn_info.port, compnode)
+            else:
+                self.prefill_nodes[host].comp_nodes[cn_info.port] = compnode
 
         elif cn_info.role == "decode":
             host = cn_info.host
@@ -48,8 +64,11 @@ class MetadataServer:
         mem_node = MemNode(mn_info, self.block_size)
         if mn_info.node_type == "prefill":
             assert mn_info.host not in self.prefill_nodes
-            self.prefill_nodes[mn_info.host] = MN2CNs(
-                host_ip=mn_info.host, mem_node=mem_node, comp_nodes={})
+            mn2cns = MN2CNs(host_ip=mn_info.host, mem_node=mem_node, comp_nodes={})
+            if self.admission is not None:
+                self.admission.add_prefill_node(mn_info.host, mn2cns)
+            else:
+                self.prefill_nodes[mn_info.host] = mn2cns
         else:
             assert mn_info.node_type == "decode"
             assert mn_info.host not in self.decode_nodes
@@ -87,9 +106,23 @@ class MetadataServer:
     def mn_count(self) -> int:
         return len(self.prefill_nodes) + len(self.decode_nodes)
 
-    def schedule_prefill(self, request: GetCompNode) -> Tuple:
+    def schedule_prefill(
+        self, request: GetCompNode
+    ) -> Union[SchedulePrefillOutput, AdmissionOutput]:
+        if self.admission is not None:
+            return self.admission.submit(request)
         return self.scheduler.schedule_prefill(request)
 
+    def poll_prefill(self, ticket_id: int) -> AdmissionOutput:
+        if self.admission is None:
+            raise ValueError("Admission control is not enabled")
+        return self.admission.poll(ticket_id)
+
+    def cancel_prefill(self, ticket_id: int) -> None:
+        if self.admission is None:
+            raise ValueError("Admission control is not enabled")
+        self.admission.cancel(ticket_id)
+
     def schedule_decode(self, request: GetCompNode) -> Tuple:
         return self.scheduler.schedule_decode(request)
 
@@ -104,7 +137,12 @@ class MetadataServer:
         if role == "prefill":
             if host not in self.prefill_nodes.keys():
                 raise ValueError(f"Compute node {role} with {host}:{port} not found")
-            self.prefill_nodes[host].comp_nodes[port].sync_status(data)
+            comp_node = self.prefill_nodes[host].comp_nodes[port]
+            # Synced request count may free capacity for queued requests
+            if self.admission is not None:
+                self.admission.on_sync(comp_node, data)
+            else:
+                comp_node.sync_status(data)
         elif role == "decode":
             if host not in self.decode_nodes.keys():
                 raise ValueError(f"Compute node {role} with {host}:{port} not found")
@@ -1,10 +1,15 @@
+from collections import deque
 from dataclasses import dataclass
-from typing import List
+from typing import Deque, List, Optional
 
 from common.block_pool import BlockPool
 from common.utils import HostIP, PORT, CompNodeCreate, CompNodeSync
 
 
+# Weight of the newest sample in the drain rate EWMA
+DRAIN_RATE_ALPHA = 0.2
+
+
 @dataclass
 class CNBaseInfo:
     host: HostIP
@@ -26,11 +31,20 @@ class CompNode:
         
         self.request_count = 0
 
+        # Admission control state, maintained by AdmissionController.
+        # Requests released to this cn that the client has not polled yet
+        self.reserved_count = 0
+        # Hand-off timestamps of requests the engine may not have reported yet
+        self.pending_admits: Deque[float] = deque()
+        # EWMA of finished requests per second, None until a sample is taken
+        self.drain_rate: Optional[float] = None
+        self.last_sync_time: Optional[float] = None
+
     def _sync_request_count(self, request_count: int) -> None:
         self.request_count = request_count
     
-    def _sync_blocks(self, gpu_blocks) -> None:
-        self.gpu_pool.sync_status(gpu_blocks)
+    def _sync_blocks(self, gpu_blocks: List[int]) -> None:
+        self.gpu_pool._sync_block_hashes(gpu_blocks)
 
     def sync_status(self, data: CompNodeSync) -> None:
         self._sync_blocks(data.gpu_blocks)
@@ -38,3 +52,45 @@ class CompNode:
 
     def get_free_blocks(self) -> int:
         return self.gpu_pool.get_free_blocks()
+
+    @property
+    def outstanding_count(self) -> int:
+        return self.request_count + self.reserved_count + len(self.pending_admits)
+
+    def reserve_request(self) -> None:
+        self.reserved_count += 1
+
+    def unreserve_request(self) -> None:
+        assert self.reserved_count > 0
+        self.reserved_count -= 1
+
+    def admit_request(self, now: float) -> None:
+        self.pending_admits.append(now)
+
+    def settle_admits(self, num_arrived: int) -> int:
+        """Drop the oldest num_arrived admits, which the engine now reports.
+
+        Return the number of dropped admits.
+        """
+        num_settled = min(max(0, num_arrived), len(self.pending_admits))
+        for _ in range(num_settled):
+            self.pending_admits.popleft()
+        return num_settled
+
+    def expire_admits(self, deadline: float) -> int:
+        """Drop admits handed off before deadline, which the engine should report by now.
+
+        Return the number of dropped admits.
+        """
+        num_expired = 0
+        while self.pending_admits and self.pending_admits[0] <= deadline:
+            self.pending_admits.popleft()
+            num_expired += 1
+        return num_expired
+
+    def update_drain_rate(self, rate: float) -> None:
+        if self.drain_rate is None:
+            self.drain_rate = rate
+        else:
+            self.drain_rate = (DRAIN_RATE_ALPHA * rate +
+                               (1 - DRAIN_RATE_ALPHA) * self.drain_rate)
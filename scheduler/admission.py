@@ -0,0 +1,337 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from scheduler.base_scheduler import BaseScheduler
+from nodes.utils import MN2CNs
+from nodes.comp_node import CompNode
+from common.utils import (Counter, HostIP, GetCompNode, CompNodeSync,
+                          AdmissionOutput, SchedulePrefillOutput)
+
+
+DEFAULT_TENANT = "default"
+
+
+@dataclass
+class AdmissionConfig:
+    # Max requests outstanding on a single prefill cn
+    max_requests_per_cn: int
+    # Max requests held in the server side queues
+    max_queue_len: int = 1024
+    # Reject requests whose estimated wait exceeds this (seconds)
+    max_wait: Optional[float] = None
+    # Upper bound (seconds) on how long a handed off request stays charged to
+    # its cn on top of the synced request count, if syncs do not settle it
+    admit_grace: float = 1.0
+    # Drop queued requests not polled for this long (seconds)
+    poll_timeout: float = 30.0
+    # Drop released requests not polled for this long (seconds)
+    result_ttl: float = 30.0
+
+
+@dataclass
+class QueuedRequest:
+    ticket_id: int
+    request: GetCompNode
+    tenant: str
+    priority: int
+    last_poll_time: float
+
+
+@dataclass
+class ReleasedRequest:
+    schedule: SchedulePrefillOutput
+    release_time: float
+
+
+class AdmissionController:
+    """ Cap outstanding requests per prefill cn and hold the excess.
+
+    Queued requests are kept per priority level (lower value served first),
+    and tenants within one level are served round robin. Requests are released
+    when capacity frees up (cn sync, new cn, cancel), clients poll for the result.
+    Tickets that are not polled in time are dropped.
+    """
+
+    def __init__(
+        self,
+        config: AdmissionConfig,
+        prefill_nodes: Dict[HostIP, MN2CNs],
+        scheduler: BaseScheduler,
+        clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        assert config.max_requests_per_cn > 0
+        self.config = config
+        self.prefill_nodes = prefill_nodes
+        self.scheduler = scheduler
+        self.clock = clock
+
+        # priority -> tenant -> FIFO of queued requests
+        self.queues: Dict[int, OrderedDict[str, Deque[QueuedRequest]]] = {}
+        self.queued: Dict[int, QueuedRequest] = {}
+        # Released requests waiting to be polled
+        self.released: Dict[int, ReleasedRequest] = {}
+
+        self.ticket_counter = Counter()
+        self.lock = threading.Lock()
+
+    ##############################################################
+    #                      Capacity helpers                      #
+    ##############################################################
+    def _free_slots(self, comp_node: CompNode) -> int:
+        return self.config.max_requests_per_cn - comp_node.outstanding_count
+
+    def _least_loaded_cn(
+        self, host_ip: Optional[HostIP] = None
+    ) -> Optional[Tuple[HostIP, int, CompNode]]:
+        """Return (host_ip, port, comp_node) with the most free slots, None if all full.
+
+        Only cns on host_ip are considered if it is given.
+        """
+        hosts = self.prefill_nodes.keys() if host_ip is None else [host_ip]
+        best = None
+        best_free = 0
+        for host in hosts:
+            for port, comp_node in self.prefill_nodes[host].comp_nodes.items():
+                free = self._free_slots(comp_node)
+                if free > best_free:
+                    best_free = free
+                    best = (host, port, comp_node)
+        return best
+
+    def _over_capacity(self) -> int:
+        """Number of requests that must finish before any queued one fits"""
+        over = 0
+        for mn2cns in self.prefill_nodes.values():
+            for comp_node in mn2cns.comp_nodes.values():
+                over += max(0, -self._free_slots(comp_node))
+        return over
+
+    def _drain_rate(self) -> float:
+        rate = 0.0
+        for mn2cns in self.prefill_nodes.values():
+            for comp_node in mn2cns.comp_nodes.values():
+                if comp_node.drain_rate is not None:
+                    rate += comp_node.drain_rate
+        return rate
+
+    def _sync_drain_rate(self, comp_node: CompNode, data: CompNodeSync, now: float) -> None:
+        """Settle pending admits and sample the drain rate of a cn at a sync.
+
+        A rise of the synced request count is taken as arrivals of the oldest
+        pending admits. Admits handed off before the previous sync (or longer
+        than admit_grace ago) had a full sync interval to reach the engine and
+        are assumed to have arrived, even if finishes hid them from the count.
+        Each admit arrives exactly once, so finished = old + arrived - new.
+        Idle intervals (not saturated and nothing finished) are skipped, otherwise
+        the rate decays towards zero while idle and the next burst is rejected.
+        """
+        saturated = self._free_slots(comp_node) <= 0
+        last_sync_time = comp_node.last_sync_time
+
+        arrived = comp_node.settle_admits(data.request_count - comp_node.request_count)
+        deadline = now - self.config.admit_grace
+        if last_sync_time is not None:
+            deadline = max(deadline, last_sync_time)
+        arrived += comp_node.expire_admits(deadline)
+        # Negative only if requests bypassed admission, nothing known finished then
+        finished = max(0, comp_node.request_count + arrived - data.request_count)
+
+        if (last_sync_time is not None and now > last_sync_time
+                and (finished > 0 or saturated)):
+            comp_node.update_drain_rate(finished / (now - last_sync_time))
+        comp_node.last_sync_time = now
+
+    def _comp_node(self, schedule: SchedulePrefillOutput) -> CompNode:
+        return self.prefill_nodes[schedule.cn_host_ip].comp_nodes[schedule.cn_port]
+
+    def _admit(self, request: GetCompNode) -> Tuple[SchedulePrefillOutput, CompNode]:
+        """Schedule a request, caller must make sure some cn has a free slot.
+
+        If the cn picked by the scheduler is full, fall back to the least loaded
+        cn on the same host to keep prefix caching local, then to the least loaded
+        cn overall. mn_host_ip is kept so prefix caching can be fetched remotely.
+        """
+        output = self.scheduler.schedule_prefill(request)
+        comp_node = self.prefill_nodes[output.cn_host_ip].comp_nodes[output.cn_port]
+        if self._free_slots(comp_node) <= 0:
+            target = (self._least_loaded_cn(output.cn_host_ip) or
+                      self._least_loaded_cn())
+            output.cn_host_ip, output.cn_port, comp_node = target
+        return output, comp_node
+
+    ##############################################################
+    #                        Queue helpers                       #
+    ##############################################################
+    def _enqueue(self, item: QueuedRequest) -> None:
+        tenants = self.queues.setdefault(item.priority, OrderedDict())
+        tenants.setdefault(item.tenant, deque()).append(item)
+        self.queued[item.ticket_id] = item
+
+    def _peek(self) -> QueuedRequest:
+        """Return the next request to serve without removing it"""
+        tenants = self.queues[min(self.queues)]
+        return next(iter(tenants.values()))[0]
+
+    def _remove(self, item: QueuedRequest) -> None:
+        tenants = self.queues[item.priority]
+        tenants[item.tenant].remove(item)
+        if not tenants[item.tenant]:
+            del tenants[item.tenant]
+        if not tenants:
+            del self.queues[item.priority]
+        del self.queued[item.ticket_id]
+
+    def _dequeue(self) -> QueuedRequest:
+        item = self._peek()
+        # Move the tenant to the back for fairness
+        self.queues[item.priority].move_to_end(item.tenant)
+        self._remove(item)
+        return item
+
+    def _expire(self, now: float) -> None:
+        """Drop tickets whose client stopped polling"""
+        for item in list(self.queued.values()):
+            if now - item.last_poll_time > self.config.poll_timeout:
+                self._remove(item)
+
+        for ticket_id, released in list(self.released.items()):
+            if now - released.release_time > self.config.result_ttl:
+                del self.released[ticket_id]
+                self._comp_node(released.schedule).unreserve_request()
+
+    def _release(self, now: float) -> int:
+        num_released = 0
+        while self.queued and self._least_loaded_cn() is not None:
+            item = self._peek()
+            # Only dequeue after scheduling succeeds so a failure keeps the ticket
+            try:
+                schedule, comp_node = self._admit(item.request)
+            except Exception as e:
+                print(f"Release ticket {item.ticket_id} failed: {e!r}")
+                break
+            # Charged from now on, counted as handed off once the client polls it
+            comp_node.reserve_request()
+            self._dequeue()
+            self.released[item.ticket_id] = ReleasedRequest(schedule, now)
+            num_released += 1
+        return num_released
+
+    def _num_ahead(self, priority: int, tenant: str, idx: int) -> int:
+        """Number of queued requests served before the idx-th request of a tenant"""
+        num_ahead = 0
+        for p, tenants in self.queues.items():
+            for t, tenant_queue in tenants.items():
+                if p < priority:
+                    num_ahead += len(tenant_queue)
+                elif p == priority and t != tenant:
+                    num_ahead += min(len(tenant_queue), idx + 1)
+        return num_ahead + idx
+
+    def _estimate_wait(self, priority: int, tenant: str, idx: int) -> Optional[float]:
+        rate = self._drain_rate()
+        if rate <= 0:
+            return None
+        num_ahead = self._num_ahead(priority, tenant, idx) + self._over_capacity()
+        return (num_ahead + 1) / rate
+
+    ##############################################################
+    #                          Public APIs                       #
+    ##############################################################
+    def submit(self, request: GetCompNode) -> AdmissionOutput:
+        """Admit a prefill request now, queue it, or reject it fast"""
+        with self.lock:
+            now = self.clock()
+            self._expire(now)
+            self._release(now)
+
+            # Do not let new requests overtake the queued ones
+            if not self.queued and self._least_loaded_cn() is not None:
+                schedule, comp_node = self._admit(request)
+                comp_node.admit_request(now)
+                return AdmissionOutput("admitted", schedule=schedule)
+
+            if len(self.queued) >= self.config.max_queue_len:
+                return AdmissionOutput("rejected")
+
+            tenant = request.tenant or DEFAULT_TENANT
+            priority = request.priority
+            tenant_queue = self.queues.get(priority, {}).get(tenant, ())
+            estimated_wait = self._estimate_wait(priority, tenant, len(tenant_queue))
+            if (self.config.max_wait is not None and estimated_wait is not None
+                    and estimated_wait > self.config.max_wait):
+                return AdmissionOutput("rejected", estimated_wait=estimated_wait)
+
+            ticket_id = next(self.ticket_counter)
+            self._enqueue(QueuedRequest(ticket_id, request, tenant, priority, now))
+            return AdmissionOutput("queued", ticket_id, estimated_wait)
+
+    def on_sync(self, comp_node: CompNode, data: CompNodeSync) -> int:
+        """Sync a prefill cn and release queued requests, return the number released"""
+        with self.lock:
+            now = self.clock()
+            self._sync_drain_rate(comp_node, data, now)
+            comp_node.sync_status(data)
+            self._expire(now)
+            return self._release(now)
+
+    def add_prefill_node(self, host_ip: HostIP, mn2cns: MN2CNs) -> None:
+        with self.lock:
+            self.prefill_nodes[host_ip] = mn2cns
+
+    def add_cn(self, host_ip: HostIP, port: int, comp_node: CompNode) -> int:
+        """Add a prefill cn and release queued requests, return the number released"""
+        with self.lock:
+            self.prefill_nodes[host_ip].comp_nodes[port] = comp_node
+            now = self.clock()
+            self._expire(now)
+            return self._release(now)
+
+    def release(self) -> int:
+        """Admit queued requests while capacity allows, return the number released"""
+        with self.lock:
+            now = self.clock()
+            self._expire(now)
+            return self._release(now)
+
+    def poll(self, ticket_id: int) -> AdmissionOutput:
+        with self.lock:
+            now = self.clock()
+            self._expire(now)
+
+            if ticket_id in self.released:
+                released = self.released.pop(ticket_id)
+                comp_node = self._comp_node(released.schedule)
+                comp_node.unreserve_request()
+                comp_node.admit_request(now)
+                return AdmissionOutput("admitted", ticket_id, schedule=released.schedule)
+
+            if ticket_id not in self.queued:
+                raise ValueError(f"Admission ticket {ticket_id} not found")
+
+            item = self.queued[ticket_id]
+            item.last_poll_time = now
+            idx = self.queues[item.priority][item.tenant].index(item)
+            estimated_wait = self._estimate_wait(item.priority, item.tenant, idx)
+            return AdmissionOutput("queued", ticket_id, estimated_wait)
+
+    def cancel(self, ticket_id: int) -> None:
+        with self.lock:
+            now = self.clock()
+            if ticket_id in self.queued:
+                self._remove(self.queued[ticket_id])
+            elif ticket_id in self.released:
+                # Never handed off, give the slot back
+                released = self.released.pop(ticket_id)
+                self._comp_node(released.schedule).unreserve_request()
+            else:
+                raise ValueError(f"Admission ticket {ticket_id} not found")
+
+            self._expire(now)
+            self._release(now)
+
+    @property
+    def queue_len(self) -> int:
+        return len(self.queued)
@@ -0,0 +1,297 @@
+import pytest
+from pydantic import ValidationError
+
+from common.utils import (GetCompNode, CompNodeCreate, MemNodeCreate,
+                          CompNodeSync, MAX_PRIORITY)
+from metadata_server import MetadataServer
+from nodes.comp_node import DRAIN_RATE_ALPHA
+from scheduler.admission import AdmissionConfig
+
+
+class FakeClock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_server(num_cns=1, hosts=("h1",), **config_kwargs):
+    config_kwargs.setdefault("max_requests_per_cn", 1)
+    server = MetadataServer(admission_config=AdmissionConfig(**config_kwargs))
+    clock = FakeClock()
+    server.admission.clock = clock
+    for host in hosts:
+        server.add_mn(MemNodeCreate(host=host, node_type="prefill", num_blocks=16))
+        for port in range(num_cns):
+            server.add_cn(CompNodeCreate(
+                host=host, port=port, role="prefill", num_blocks=16))
+    return server, clock
+
+
+def sync(server, request_count, host="h1", port=0):
+    server.sync_compnode(CompNodeSync(
+        host=host, port=port, role="prefill",
+        request_count=request_count, gpu_blocks=[]))
+
+
+def submit(server, tenant=None, priority=0, block_hashes=()):
+    return server.schedule_prefill(GetCompNode(
+        block_hashes=list(block_hashes), tenant=tenant, priority=priority))
+
+
+def test_admit_then_queue():
+    server, _ = make_server()
+    ret = submit(server)
+    assert ret.status == "admitted"
+    assert ret.schedule.cn_host_ip == "h1"
+
+    ret = submit(server)
+    assert ret.status == "queued"
+    assert ret.ticket_id is not None
+
+
+def test_tenant_round_robin_and_priority_order():
+    server, clock = make_server()
+    submit(server)
+    tickets = {}
+    for name, tenant, priority in [("a0", "a", 1), ("a1", "a", 1), ("a2", "a", 1),
+                                   ("b0", "b", 1), ("c0", "c", 0)]:
+        tickets[name] = submit(server, tenant, priority).ticket_id
+
+    order = []
+    for i in range(len(tickets)):
+        clock.now += 2
+        sync(server, 0)
+        order += [name for name, t in tickets.items() if name not in order
+                  and server.poll_prefill(t).status == "admitted"]
+    assert order == ["c0", "a0", "b0", "a1", "a2"]
+
+
+def test_priority_is_bounded():
+    with pytest.raises(ValidationError):
+        GetCompNode(block_hashes=[], priority=-1)
+    with pytest.raises(ValidationError):
+        GetCompNode(block_hashes=[], priority=MAX_PRIORITY + 1)
+
+
+def test_reject_when_queue_full():
+    server, _ = make_server(max_queue_len=2)
+    submit(server)
+    assert submit(server).status == "queued"
+    assert submit(server).status == "queued"
+    assert submit(server).status == "rejected"
+
+
+def test_reject_when_max_wait_exceeded():
+    server, clock = make_server(max_wait=1.0)
+    # Saturated cn finishing 1 request per second
+    sync(server, 5)
+    clock.now += 1
+    sync(server, 4)
+
+    ret = submit(server)
+    assert ret.status == "rejected"
+    assert ret.estimated_wait == pytest.approx(4.0)
+
+
+def test_release_on_sync():
+    server, clock = make_server()
+    submit(server)
+    ticket = submit(server).ticket_id
+
+    # Admit is still within the grace window, the cn stays charged
+    sync(server, 0)
+    assert server.poll_prefill(ticket).status == "queued"
+
+    clock.now += 2
+    sync(server, 0)
+    ret = server.poll_prefill(ticket)
+    assert ret.status == "admitted"
+    assert ret.schedule.cn_port == 0
+    with pytest.raises(ValueError):
+        server.poll_prefill(ticket)
+
+
+def test_release_on_add_cn():
+    server, _ = make_server()
+    submit(server)
+    ticket = submit(server).ticket_id
+    server.add_cn(CompNodeCreate(host="h1", port=1, role="prefill", num_blocks=16))
+    assert server.poll_prefill(ticket).status == "admitted"
+
+
+def test_cancel_queued_ticket():
+    server, clock = make_server()
+    submit(server)
+    first = submit(server).ticket_id
+    second = submit(server).ticket_id
+    server.cancel_prefill(first)
+    with pytest.raises(ValueError):
+        server.poll_prefill(first)
+
+    clock.now += 2
+    sync(server, 0)
+    assert server.poll_prefill(second).status == "admitted"
+
+
+def test_cancel_released_ticket_frees_slot():
+    server, clock = make_server()
+    submit(server)
+    first = submit(server).ticket_id
+    second = submit(server).ticket_id
+
+    clock.now += 2
+    sync(server, 0)
+    assert first in server.admission.released
+    server.cancel_prefill(first)
+    with pytest.raises(ValueError):
+        server.poll_prefill(first)
+    assert server.poll_prefill(second).status == "admitted"
+
+
+def test_expire_unpolled_tickets():
+    server, clock = make_server(poll_timeout=5.0, result_ttl=5.0)
+    submit(server)
+    released = submit(server).ticket_id
+    clock.now += 2
+    sync(server, 0)
+    assert released in server.admission.released
+
+    queued = submit(server).ticket_id
+    clock.now += 6
+    sync(server, 1)
+    for ticket in (released, queued):
+        with pytest.raises(ValueError):
+            server.poll_prefill(ticket)
+    # The expired release no longer holds a slot
+    assert server.prefill_nodes["h1"].comp_nodes[0].outstanding_count == 1
+
+
+def test_release_failure_keeps_ticket():
+    server, clock = make_server()
+    submit(server)
+    ticket = submit(server).ticket_id
+
+    def fail(request):
+        raise ZeroDivisionError
+    schedule_prefill = server.scheduler.schedule_prefill
+    server.scheduler.schedule_prefill = fail
+    clock.now += 2
+    sync(server, 0)
+    assert server.poll_prefill(ticket).status == "queued"
+
+    server.scheduler.schedule_prefill = schedule_prefill
+    clock.now += 1
+    sync(server, 0)
+    assert server.poll_prefill(ticket).status == "admitted"
+
+
+def test_admit_prefers_free_cn_on_same_host():
+    server, _ = make_server(num_cns=2, hosts=("h1", "h2"), max_requests_per_cn=2)
+    server.prefill_nodes["h1"].mem_node.block_hashes = {1, 2}
+    # Scheduler picks h1:0 which is full, h1:1 still has a slot
+    sync(server, 2, "h1", 0)
+    sync(server, 1, "h1", 1)
+
+    ret = submit(server, block_hashes=[1, 2])
+    assert ret.status == "admitted"
+    assert ret.schedule.mn_host_ip == "h1"
+    assert (ret.schedule.cn_host_ip, ret.schedule.cn_port) == ("h1", 1)
+
+
+def test_admit_falls_back_to_least_loaded_cn():
+    server, _ = make_server(num_cns=2, hosts=("h1", "h2"), max_requests_per_cn=2)
+    server.prefill_nodes["h1"].mem_node.block_hashes = {1, 2}
+    # Saturate both cns on h1, leave h2 free
+    sync(server, 2, "h1", 0)
+    sync(server, 2, "h1", 1)
+    sync(server, 1, "h2", 0)
+
+    ret = submit(server, block_hashes=[1, 2])
+    assert ret.status == "admitted"
+    assert ret.schedule.mn_host_ip == "h1"
+    assert (ret.schedule.cn_host_ip, ret.schedule.cn_port) == ("h2", 1)
+
+
+def test_drain_rate_estimate():
+    server, clock = make_server(max_requests_per_cn=2)
+    sync(server, 6)
+    clock.now += 1
+    sync(server, 4)
+    comp_node = server.prefill_nodes["h1"].comp_nodes[0]
+    assert comp_node.drain_rate == pytest.approx(2.0)
+
+    # 2 over capacity, 1 ahead in the queue
+    assert submit(server).estimated_wait == pytest.approx(1.5)
+    assert submit(server).estimated_wait == pytest.approx(2.0)
+
+
+def test_idle_syncs_keep_drain_rate():
+    server, clock = make_server(max_requests_per_cn=4, max_wait=5.0)
+    for request_count in (20, 16, 12, 8, 4):
+        sync(server, request_count)
+        clock.now += 1
+    for _ in range(30):
+        sync(server, 0)
+        clock.now += 1
+    comp_node = server.prefill_nodes["h1"].comp_nodes[0]
+    assert comp_node.drain_rate == pytest.approx(4.0)
+
+    for _ in range(4):
+        assert submit(server).status == "admitted"
+    ret = submit(server)
+    assert ret.status == "queued"
+    assert ret.estimated_wait == pytest.approx(0.25)
+
+
+def test_sync_settles_admits():
+    server, clock = make_server(max_requests_per_cn=4)
+    for _ in range(4):
+        assert submit(server).status == "admitted"
+    comp_node = server.prefill_nodes["h1"].comp_nodes[0]
+
+    # Arrivals seen in the synced count are not charged twice
+    clock.now += 0.1
+    sync(server, 4)
+    assert comp_node.outstanding_count == 4
+
+    # Finished requests free their slots without waiting for admit_grace
+    clock.now += 0.1
+    sync(server, 0)
+    assert comp_node.outstanding_count == 0
+    assert submit(server).status == "admitted"
+
+
+def test_sync_settles_admits_hidden_by_finishes():
+    server, clock = make_server(max_requests_per_cn=4)
+    sync(server, 2)
+    clock.now += 0.05
+    submit(server)
+    submit(server)
+    comp_node = server.prefill_nodes["h1"].comp_nodes[0]
+
+    # 2 arrived and 2 finished, the count does not move
+    clock.now += 0.05
+    sync(server, 2)
+    assert comp_node.outstanding_count == 4
+
+    # Handed off before the previous sync, so they have arrived by now
+    clock.now += 0.1
+    sync(server, 2)
+    assert comp_node.outstanding_count == 2
+    # The hidden finishes count one interval late: EWMA of samples 0 and 20
+    assert comp_node.drain_rate == pytest.approx(DRAIN_RATE_ALPHA * 20.0)
+
+
+def test_drain_rate_zero_when_nothing_finishes():
+    server, clock = make_server(max_requests_per_cn=4, admit_grace=1.0)
+    for _ in range(4):
+        submit(server)
+    comp_node = server.prefill_nodes["h1"].comp_nodes[0]
+    for _ in range(10):
+        sync(server, 4)
+        clock.now += 0.5
+        assert comp_node.drain_rate in (None, 0.0)
+    assert comp_node.drain_rate == 0.0